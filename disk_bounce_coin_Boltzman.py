@@ -1,6 +1,8 @@
 import pygame
 import random
-import math
+import numpy as np
+from disk_physics import (make_broad_phase_state, make_coin_histogram, make_hist_log,
+                          make_random_pool, step)
 
 # --- Constants ---
 WIDTH, HEIGHT = 800, 600   # Size of the window
@@ -11,102 +13,50 @@ DISK_COUNT = 6
 # For demonstration, we won't actually draw 8 small "coin" circles inside,
 # but we'll keep track of them in a list. You can add more advanced graphics later.
 MAX_COINS_PER_DISK = 8
-
-# --- Disk Class ---
-class Disk:
-    def __init__(self, x, y, vx, vy, radius, coin_count=0):
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
-        self.radius = radius
-        # Instead of a count, you could store e.g. self.coins = ["coin"] * coin_count
-        # if you need to manage them individually. For now a count is enough.
-        self.coin_count = coin_count
-    
-    def update_position(self, dt):
-        """Move the disk, bounce off the walls if hitting edges."""
-        self.x += self.vx * dt
-        self.y += self.vy * dt
-        
-        # Check for collision with left/right walls
-        if self.x - self.radius < 0:
-            self.x = self.radius
-            self.vx = -self.vx
-        elif self.x + self.radius > WIDTH:
-            self.x = WIDTH - self.radius
-            self.vx = -self.vx
-        
-        # Check for collision with top/bottom walls
-        if self.y - self.radius < 0:
-            self.y = self.radius
-            self.vy = -self.vy
-        elif self.y + self.radius > HEIGHT:
-            self.y = HEIGHT - self.radius
-            self.vy = -self.vy
-
-    def draw(self, screen, font):
-        """Draw the disk and the coin count on top."""
-        pygame.draw.circle(screen, (0, 128, 255), (int(self.x), int(self.y)), self.radius)
-        
+BROAD_PHASE = "all"        # Collision broad phase: "all" (every pair, best for a few disks),
+                           # "sweep" (sweep-and-prune), "grid" or "quadtree"
+PHYSICS_DT = 1 / 240       # Fixed physics timestep in seconds, independent of FPS
+MAX_FRAME_TIME = 0.25      # Cap on real time simulated per frame, so a stall cannot snowball
+
+# --- Disk state ---
+# One array per field (structure of arrays), indexed by disk number, so the
+# compiled kernels in disk_physics loop over contiguous memory each frame.
+xs = np.empty(DISK_COUNT, dtype=np.float64)
+ys = np.empty(DISK_COUNT, dtype=np.float64)
+vxs = np.empty(DISK_COUNT, dtype=np.float64)
+vys = np.empty(DISK_COUNT, dtype=np.float64)
+# Instead of a count, you could store e.g. a coin array per disk
+# if you need to manage them individually. For now a count is enough.
+coins = np.zeros(DISK_COUNT, dtype=np.int32)
+
+# Shared PCG64 random generator. Coin flips are taken from a pool of random
+# bits that is refilled from it in bulk, rather than one generator call each.
+rng = np.random.default_rng()
+random_pool = make_random_pool(rng)
+
+def render_coin_labels(font):
+    """
+    Render the coin count text for every possible count 0..MAX_COINS_PER_DISK once,
+    so drawing a disk is a blit instead of a font render. Call again if the font changes.
+    """
+    return [font.render(str(i), True, (255, 255, 255)) for i in range(MAX_COINS_PER_DISK + 1)]
+
+def render_disk_sprite():
+    """Rasterize the disk circle once; every disk is then drawn by blitting this sprite."""
+    sprite = pygame.Surface((2 * DISK_RADIUS + 2, 2 * DISK_RADIUS + 2), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, (0, 128, 255), (DISK_RADIUS + 1, DISK_RADIUS + 1), DISK_RADIUS)
+    return sprite.convert_alpha()
+
+def draw_disks(screen, disk_sprite, coin_labels, xs, ys, coins):
+    """Draw every disk and its coin count on top, in a single blits() call."""
+    blit_list = []
+    for i in range(DISK_COUNT):
+        x, y = int(xs[i]), int(ys[i])
+        blit_list.append((disk_sprite, (x - DISK_RADIUS - 1, y - DISK_RADIUS - 1)))
         # Draw the number of coins
-        text_surface = font.render(str(self.coin_count), True, (255, 255, 255))
-        text_rect = text_surface.get_rect(center=(int(self.x), int(self.y)))
-        screen.blit(text_surface, text_rect)
-
-def distance(disk1, disk2):
-    """Euclidian distance between two disk centers."""
-    dx = disk2.x - disk1.x
-    dy = disk2.y - disk1.y
-    return math.sqrt(dx*dx + dy*dy)
-
-def handle_disk_collision(disk1, disk2):
-    """Check if disks collide. If they do, perform elastic collision and coin exchange."""
-    dist = distance(disk1, disk2)
-    if dist < disk1.radius + disk2.radius:
-        # --- Simple elastic collision for equal masses ---
-        # 1) Find the collision normal
-        nx = (disk2.x - disk1.x) / dist
-        ny = (disk2.y - disk1.y) / dist
-
-        # 2) Project velocities onto normal
-        v1n = disk1.vx * nx + disk1.vy * ny
-        v2n = disk2.vx * nx + disk2.vy * ny
-
-        # 3) Swap the normal components (like 1D elastic collision along that normal)
-        disk1.vx += (v2n - v1n) * nx
-        disk1.vy += (v2n - v1n) * ny
-        disk2.vx += (v1n - v2n) * nx
-        disk2.vy += (v1n - v2n) * ny
-
-        # --- Coin exchange: for each coin in total, flip a coin to move it or not ---
-        # For clarity, let's treat each disk's coin_count as if each "coin" is processed individually
-        total_coins_disk1 = disk1.coin_count
-        total_coins_disk2 = disk2.coin_count
-
-        # We'll handle them all from the perspective of disk1 first
-        # Then from the perspective of disk2. Another approach is to actually keep
-        # coin arrays, but here's a simplified logic:
-        
-        # For disk1's coins:
-        coins_moving_to_disk2 = 0
-        for _ in range(total_coins_disk1):
-            if random.random() < 0.5:
-                coins_moving_to_disk2 += 1
-        disk1.coin_count -= coins_moving_to_disk2
-        disk2.coin_count += coins_moving_to_disk2
-        
-        # For disk2's coins:
-        coins_moving_to_disk1 = 0
-        for _ in range(total_coins_disk2):
-            if random.random() < 0.5:
-                coins_moving_to_disk1 += 1
-        disk2.coin_count -= coins_moving_to_disk1
-        disk1.coin_count += coins_moving_to_disk1
-        
-        # You could clamp coin counts to the max if needed:
-        disk1.coin_count = min(disk1.coin_count, MAX_COINS_PER_DISK)
-        disk2.coin_count = min(disk2.coin_count, MAX_COINS_PER_DISK)
+        text_surface = coin_labels[coins[i]]
+        blit_list.append((text_surface, text_surface.get_rect(center=(x, y))))
+    screen.blits(blit_list, doreturn=False)
 
 def main():
     pygame.init()
@@ -116,50 +66,62 @@ def main():
 
     # Prepare a font for drawing coin counts
     font = pygame.font.SysFont(None, 24)
+    coin_labels = render_coin_labels(font)
+    disk_sprite = render_disk_sprite()
 
     # --- Create 6 disks ---
     # - 4 disks start with 1 coin each
     # - 2 disks start with 2 coins each
     # We have to ensure total 8 coins across them.
-    disks = []
     coin_distribution = [1, 1, 1, 1, 2, 2]  # 4 disks with 1 coin, 2 with 2 coins
 
     for i in range(DISK_COUNT):
         # Random initial position (with some padding so they start inside the box)
-        x = random.randint(DISK_RADIUS, WIDTH - DISK_RADIUS)
-        y = random.randint(DISK_RADIUS, HEIGHT - DISK_RADIUS)
+        xs[i] = random.randint(DISK_RADIUS, WIDTH - DISK_RADIUS)
+        ys[i] = random.randint(DISK_RADIUS, HEIGHT - DISK_RADIUS)
 
         # Random velocity
-        vx = random.uniform(-200, 200)
-        vy = random.uniform(-200, 200)
+        vxs[i] = random.uniform(-200, 200)
+        vys[i] = random.uniform(-200, 200)
 
-        # Create the disk
-        disk = Disk(x, y, vx, vy, DISK_RADIUS, coin_count=coin_distribution[i])
-        disks.append(disk)
+        coins[i] = coin_distribution[i]
+
+    # Disks per coin count, kept current by step() as coins change hands
+    hist = make_coin_histogram(coins, MAX_COINS_PER_DISK)
+    # Coin histogram after each collision, filled in by step()
+    hist_log = make_hist_log(DISK_COUNT, MAX_COINS_PER_DISK)
+    # Candidate pairs and sweep order that the broad phase keeps across steps
+    broad_phase_state = make_broad_phase_state(DISK_COUNT)
+    # Positions before the latest physics step, for interpolating the drawing
+    prev_xs, prev_ys = xs.copy(), ys.copy()
+    accumulator = 0.0
 
     running = True
     while running:
-        dt = clock.tick(FPS) / 1000.0  # dt in seconds
+        # Real time since the last frame in seconds, to be simulated in fixed steps
+        accumulator += min(clock.tick(FPS) / 1000.0, MAX_FRAME_TIME)
         
         # --- Event handling ---
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
         
-        # --- Update all disks ---
-        for disk in disks:
-            disk.update_position(dt)
-        
-        # --- Collision detection among disks ---
-        # We'll do a naive all-pairs check for 6 disks (that’s only 15 checks).
-        for i in range(DISK_COUNT):
-            for j in range(i + 1, DISK_COUNT):
-                handle_disk_collision(disks[i], disks[j])
+        # --- Update all disks and handle collisions among them ---
+        # step() tests the pairs chosen by its broad phase (see BROAD_PHASE).
+        while accumulator >= PHYSICS_DT:
+            prev_xs[:] = xs
+            prev_ys[:] = ys
+            step(xs, ys, vxs, vys, coins, hist, DISK_RADIUS, WIDTH, HEIGHT, MAX_COINS_PER_DISK,
+                 PHYSICS_DT, random_pool, BROAD_PHASE, broad_phase_state, hist_log)
+            accumulator -= PHYSICS_DT
         
         # --- Draw everything ---
+        # Disks are drawn between their last two physics positions, by how far
+        # real time has run into the next step
+        alpha = accumulator / PHYSICS_DT
         screen.fill((0, 0, 0))  # black background
-        for disk in disks:
-            disk.draw(screen, font)
+        draw_disks(screen, disk_sprite, coin_labels,
+                   prev_xs + alpha * (xs - prev_xs), prev_ys + alpha * (ys - prev_ys), coins)
         
         pygame.display.flip()
     
@@ -1,233 +1,175 @@
 import pygame
 import random
-import math
-import matplotlib.pyplot as plt
-
-# -----------------
-# Global variables
-# -----------------
-collision_count = 0
-cumulative_counts = [0]*9  # For coin counts 0..8
+import numpy as np
+from disk_physics import (make_broad_phase_state, make_coin_histogram, make_hist_log,
+                          make_random_pool, step)
+from plot_panel import RunningAveragePlot
 
 # --- Constants ---
-WIDTH, HEIGHT = 800, 600   # Size of the Pygame window
+WIDTH, HEIGHT = 800, 600   # Size of the area the disks move in
 FPS = 60                   # Frames per second
 DISK_RADIUS = 40           # Radius of each disk
 DISK_COUNT = 6
 MAX_COINS_PER_DISK = 8
+BROAD_PHASE = "all"        # Collision broad phase: "all" (every pair, best for a few disks),
+                           # "sweep" (sweep-and-prune), "grid" or "quadtree"
+PHYSICS_DT = 1 / 240       # Fixed physics timestep in seconds, independent of FPS
+MAX_FRAME_TIME = 0.25      # Cap on real time simulated per frame, so a stall cannot snowball
+PLOT_WIDTH = 420           # Width of the running average plot panel, right of the disks
+PLOT_Y_MAX = 1.0           # Top of the plot's y axis
 #DISK_COUNT = 3
 #MAX_COINS_PER_DISK = 4 
+# Where the final running average panel is saved when the window is closed
+PLOT_FILE = f"{DISK_COUNT}disks_{MAX_COINS_PER_DISK}coins_running_fraction.png"
 
 
+# -----------------
+# Global variables
+# -----------------
+collision_count = 0
+cumulative_counts = np.zeros(MAX_COINS_PER_DISK + 1, dtype=np.int64)  # For coin counts 0..max
+
 
 # -----------------
-# Disk class
+# Disk state
 # -----------------
-class Disk:
-    def __init__(self, x, y, vx, vy, radius, coin_count=0):
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
-        self.radius = radius
-        self.coin_count = coin_count
-    
-    def update_position(self, dt):
-        """Move the disk, bounce off the walls if hitting edges."""
-        self.x += self.vx * dt
-        self.y += self.vy * dt
-        
-        # Check for collision with left/right walls
-        if self.x - self.radius < 0:
-            self.x = self.radius
-            self.vx = -self.vx
-        elif self.x + self.radius > WIDTH:
-            self.x = WIDTH - self.radius
-            self.vx = -self.vx
-        
-        # Check for collision with top/bottom walls
-        if self.y - self.radius < 0:
-            self.y = self.radius
-            self.vy = -self.vy
-        elif self.y + self.radius > HEIGHT:
-            self.y = HEIGHT - self.radius
-            self.vy = -self.vy
-
-    def draw(self, screen, font):
-        """Draw the disk and the coin count on top."""
-        pygame.draw.circle(screen, (0, 128, 255), (int(self.x), int(self.y)), self.radius)
-        text_surface = font.render(str(self.coin_count), True, (255, 255, 255))
-        text_rect = text_surface.get_rect(center=(int(self.x), int(self.y)))
-        screen.blit(text_surface, text_rect)
+# One array per field (structure of arrays), indexed by disk number, so the
+# compiled kernels in disk_physics loop over contiguous memory each frame.
+xs = np.empty(DISK_COUNT, dtype=np.float64)
+ys = np.empty(DISK_COUNT, dtype=np.float64)
+vxs = np.empty(DISK_COUNT, dtype=np.float64)
+vys = np.empty(DISK_COUNT, dtype=np.float64)
+coins = np.zeros(DISK_COUNT, dtype=np.int32)
+
+# Shared PCG64 random generator. Coin flips are taken from a pool of random
+# bits that is refilled from it in bulk, rather than one generator call each.
+rng = np.random.default_rng()
+random_pool = make_random_pool(rng)
 
 
 # -----------------
 # Helper functions
 # -----------------
-def distance(disk1, disk2):
-    """Euclidean distance between two disk centers."""
-    dx = disk2.x - disk1.x
-    dy = disk2.y - disk1.y
-    return math.sqrt(dx*dx + dy*dy)
-
-def handle_disk_collision(disk1, disk2):
-    """
-    Check if disks collide. If they do, perform elastic collision and coin exchange.
-    Returns True if a collision actually happened, otherwise False.
-    """
-    dist = distance(disk1, disk2)
-    if dist < disk1.radius + disk2.radius:
-        # --- Simple elastic collision for equal masses ---
-        nx = (disk2.x - disk1.x) / dist
-        ny = (disk2.y - disk1.y) / dist
-        v1n = disk1.vx * nx + disk1.vy * ny
-        v2n = disk2.vx * nx + disk2.vy * ny
-
-        disk1.vx += (v2n - v1n) * nx
-        disk1.vy += (v2n - v1n) * ny
-        disk2.vx += (v1n - v2n) * nx
-        disk2.vy += (v1n - v2n) * ny
-
-        # --- Coin exchange ---
-        total_coins_disk1 = disk1.coin_count
-        total_coins_disk2 = disk2.coin_count
-
-        # For disk1's coins:
-        coins_moving_to_disk2 = 0
-        for _ in range(total_coins_disk1):
-            if random.random() < 0.5:
-                coins_moving_to_disk2 += 1
-        disk1.coin_count -= coins_moving_to_disk2
-        disk2.coin_count += coins_moving_to_disk2
-        
-        # For disk2's coins:
-        coins_moving_to_disk1 = 0
-        for _ in range(total_coins_disk2):
-            if random.random() < 0.5:
-                coins_moving_to_disk1 += 1
-        disk2.coin_count -= coins_moving_to_disk1
-        disk1.coin_count += coins_moving_to_disk1
-        
-        # Clamp coin counts
-        disk1.coin_count = min(disk1.coin_count, MAX_COINS_PER_DISK)
-        disk2.coin_count = min(disk2.coin_count, MAX_COINS_PER_DISK)
-
-        return True
-    return False
-
-
-def update_plot(disks, lines, xdata, ydata, ax):
+def render_coin_labels(font):
     """
-    Recompute how many disks have 0..8 coins, update the
-    global cumulative sums, update the lines, and redraw.
+    Render the coin count text for every possible count 0..MAX_COINS_PER_DISK once,
+    so drawing a disk is a blit instead of a font render. Call again if the font changes.
     """
-    global collision_count, cumulative_counts
+    return [font.render(str(i), True, (255, 255, 255)) for i in range(MAX_COINS_PER_DISK + 1)]
 
-    # Count how many disks are in each coin state
-    counts = [0]*9
-    for d in disks:
-        counts[d.coin_count] += 1
+def render_disk_sprite():
+    """Rasterize the disk circle once; every disk is then drawn by blitting this sprite."""
+    sprite = pygame.Surface((2 * DISK_RADIUS + 2, 2 * DISK_RADIUS + 2), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, (0, 128, 255), (DISK_RADIUS + 1, DISK_RADIUS + 1), DISK_RADIUS)
+    return sprite.convert_alpha()
 
-    # Update global cumulative sums
-    for i in range(9):
-        cumulative_counts[i] += counts[i]
+def draw_disks(screen, disk_sprite, coin_labels, xs, ys, coins):
+    """Draw every disk and its coin count on top, in a single blits() call."""
+    blit_list = []
+    for i in range(DISK_COUNT):
+        x, y = int(xs[i]), int(ys[i])
+        blit_list.append((disk_sprite, (x - DISK_RADIUS - 1, y - DISK_RADIUS - 1)))
+        text_surface = coin_labels[coins[i]]
+        blit_list.append((text_surface, text_surface.get_rect(center=(x, y))))
+    screen.blits(blit_list, doreturn=False)
 
-    # Update the running average fraction for each coin count
-    for i in range(9):
-        xdata[i].append(collision_count)
-        frac = cumulative_counts[i] / (DISK_COUNT * collision_count)
-        ydata[i].append(frac)
-        lines[i].set_xdata(xdata[i])
-        lines[i].set_ydata(ydata[i])
+def accumulate_plot(hist, plot):
+    """
+    Add hist, the number of disks with 0..MAX_COINS_PER_DISK coins, to the
+    global cumulative sums and record a point of each line's data in plot.
+    Nothing is drawn here; see RunningAveragePlot.draw().
+    """
+    global collision_count, cumulative_counts
 
-    # Dynamically adjust the plot range
-    ax.set_xlim(0, max(10, collision_count))
-    ax.relim()
-    ax.autoscale_view(False, True, True)
+    # step() already keeps the per-coin-count histogram current, so just add it
+    cumulative_counts[:len(hist)] += hist
 
-    plt.draw()
-    plt.pause(0.001)
+    # Record the running average fraction for each coin count
+    fractions = cumulative_counts[:len(hist)] / (DISK_COUNT * collision_count)
+    plot.record(collision_count, fractions)
 
 
 def main():
     global collision_count  # we will assign to it here
 
     pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    # The disks move in the left WIDTH x HEIGHT area; the plot panel sits to its right
+    screen = pygame.display.set_mode((WIDTH + PLOT_WIDTH, HEIGHT))
     pygame.display.set_caption("Bouncing Disks with Coin Exchange")
     clock = pygame.time.Clock()
 
     font = pygame.font.SysFont(None, 24)
+    coin_labels = render_coin_labels(font)
+    disk_sprite = render_disk_sprite()
 
-    # 1 disk with 8 coins, 5 disks with 0 coins
-    coin_distribution = [8, 0, 0, 0, 0, 0]
-    disks = []
+    # 1 disk with all MAX_COINS_PER_DISK coins, the others with 0, so no disk
+    # starts above the cap the coin labels are rendered for
+    coin_distribution = [MAX_COINS_PER_DISK] + [0] * (DISK_COUNT - 1)
     for i in range(DISK_COUNT):
-        x = random.randint(DISK_RADIUS, WIDTH - DISK_RADIUS)
-        y = random.randint(DISK_RADIUS, HEIGHT - DISK_RADIUS)
-        vx = random.uniform(-400, 400)
-        vy = random.uniform(-400, 400)
-        disk = Disk(x, y, vx, vy, DISK_RADIUS, coin_count=coin_distribution[i])
-        disks.append(disk)
-
-    # --- Matplotlib Setup for dynamic plotting ---
-    plt.ion()
-    fig, ax = plt.subplots()
-
-    # For macOS + some Matplotlib backends, this line doesn't work. Instead do:
-    # fig.canvas.manager.set_window_title("Running Average of Coin Counts")
-    #
-    # Or just remove it if it fails:
-    fig.canvas.manager.set_window_title("Running Average of Coin Counts")
-
-    # We'll keep 9 lines for coin counts 0..8
-    lines = []
-    xdata = [[] for _ in range(9)]
-    ydata = [[] for _ in range(9)]
-    colors = [
-        "tab:blue", "tab:orange", "tab:green", "tab:red", "tab:purple",
-        "tab:brown", "tab:pink", "tab:gray", "tab:olive"
-    ]
-    labels = [f"{i} coins" for i in range(9)]
-    for i in range(9):
-        (line,) = ax.plot([], [], color=colors[i], label=labels[i])
-        lines.append(line)
-
-    ax.set_xlim(0, 10)
-    ax.set_ylim(0, 1.0)
-    ax.legend(loc="upper right")
-    ax.set_xlabel("Collision Count")
-    ax.set_ylabel("Running Average Fraction of Disks")
+        xs[i] = random.randint(DISK_RADIUS, WIDTH - DISK_RADIUS)
+        ys[i] = random.randint(DISK_RADIUS, HEIGHT - DISK_RADIUS)
+        vxs[i] = random.uniform(-400, 400)
+        vys[i] = random.uniform(-400, 400)
+        coins[i] = coin_distribution[i]
+
+    # Disks per coin count, kept current by step() as coins change hands
+    hist = make_coin_histogram(coins, MAX_COINS_PER_DISK)
+    # Coin histogram after each collision, filled in by step()
+    hist_log = make_hist_log(DISK_COUNT, MAX_COINS_PER_DISK)
+    # Candidate pairs and sweep order that the broad phase keeps across steps
+    broad_phase_state = make_broad_phase_state(DISK_COUNT)
+    # Positions before the latest physics step, for interpolating the drawing
+    prev_xs, prev_ys = xs.copy(), ys.copy()
+    accumulator = 0.0
+
+    # --- Plot panel setup ---
+    # One line per coin count 0..MAX_COINS_PER_DISK, in the panel right of the disks
+    plot = RunningAveragePlot(font, (WIDTH, 0, PLOT_WIDTH, HEIGHT),
+                              "Running Average Fraction of Disks",
+                              PLOT_Y_MAX, MAX_COINS_PER_DISK + 1)
+    plot.draw(screen)
 
     running = True
     while running:
-        dt = clock.tick(FPS) / 1000.0
+        # Real time since the last frame in seconds, to be simulated in fixed steps
+        accumulator += min(clock.tick(FPS) / 1000.0, MAX_FRAME_TIME)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
-        # Update all disks
-        for disk in disks:
-            disk.update_position(dt)
-
-        # Collision detection among disks
-        for i in range(DISK_COUNT):
-            for j in range(i + 1, DISK_COUNT):
-                did_collide = handle_disk_collision(disks[i], disks[j])
-                if did_collide:
-                    collision_count += 1
-                    update_plot(disks, lines, xdata, ydata, ax)
-
-        screen.fill((0, 0, 0))
-        for disk in disks:
-            disk.draw(screen, font)
+        # Update all disks and resolve collisions among them, in PHYSICS_DT steps
+        frame_collisions = 0
+        while accumulator >= PHYSICS_DT:
+            prev_xs[:] = xs
+            prev_ys[:] = ys
+            n_collisions = step(xs, ys, vxs, vys, coins, hist, DISK_RADIUS, WIDTH, HEIGHT,
+                                MAX_COINS_PER_DISK, PHYSICS_DT, random_pool, BROAD_PHASE,
+                                broad_phase_state, hist_log)
+            for k in range(n_collisions):
+                collision_count += 1
+                accumulate_plot(hist_log[k], plot)
+            frame_collisions += n_collisions
+            accumulator -= PHYSICS_DT
+        # Redraw the plot only when new collisions came in; the panel is outside
+        # the disk area, so it stays on screen between redraws
+        if frame_collisions:
+            plot.draw(screen)
+
+        # Draw the disks between their last two physics positions, by how far
+        # real time has run into the next step
+        alpha = accumulator / PHYSICS_DT
+        screen.fill((0, 0, 0), (0, 0, WIDTH, HEIGHT))
+        draw_disks(screen, disk_sprite, coin_labels,
+                   prev_xs + alpha * (xs - prev_xs), prev_ys + alpha * (ys - prev_ys), coins)
 
         pygame.display.flip()
 
+    # Keep the converged plot: save the final panel before the window goes away
+    plot.draw(screen)
+    plot.save(screen, PLOT_FILE)
+    print(f"Saved the running average plot to {PLOT_FILE}")
     pygame.quit()
-    plt.ioff()
-    plt.show()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,540 @@
+"""
+Numba-compiled physics kernels shared by the bouncing disk simulations.
+
+The kernels work on the structure-of-arrays disk state owned by each script
+(xs, ys, vxs, vys as float64 arrays, coins as an int32 array) and update it
+in place.
+"""
+import math
+import numpy as np
+from numba import njit
+
+EPSILON = 1e-5             # Small value to avoid division by zero
+SKIN_FRACTION = 0.5        # Broad phase margin around each disk, as a fraction of its radius
+RANDOM_POOL_SIZE = 4096    # Random 32-bit words drawn from the generator per refill
+QUADTREE_CAPACITY = 4      # Max disks in a quadtree leaf before it is subdivided
+QUADTREE_MAX_DEPTH = 16    # Stop subdividing here, e.g. when disks sit on top of each other
+
+# Number of set bits in each byte value, for counting heads in a word of coin flips
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+@njit(cache=True)
+def fair_coin_flips(n, random_pool):
+    """
+    Number of heads in n fair coin flips, i.e. a binomial(n, 0.5) sample.
+
+    For n <= 32 this takes the next 32-bit word from random_pool (see
+    make_random_pool()), keeps its low n bits and counts the ones; the pool is
+    refilled from the generator in bulk when it runs out.
+    """
+    rng, bits, pos = random_pool
+    if n > 32:
+        return rng.binomial(n, 0.5)
+    if pos[0] == bits.shape[0]:
+        bits[:] = rng.integers(0, 1 << 32, size=bits.shape[0], dtype=np.uint32)
+        pos[0] = 0
+    word = bits[pos[0]] & ((1 << n) - 1)
+    pos[0] += 1
+    return (POPCOUNT_8[word & 0xFF] + POPCOUNT_8[(word >> 8) & 0xFF]
+            + POPCOUNT_8[(word >> 16) & 0xFF] + POPCOUNT_8[(word >> 24) & 0xFF])
+
+
+@njit(cache=True)
+def update_positions(xs, ys, vxs, vys, radius, width, height, dt):
+    """
+    Move all disks, bounce off the walls if hitting edges.
+
+    The bounce is written without branches: clamp the position into the box and
+    flip the velocity sign wherever it was outside, which LLVM lowers to
+    min/max and select instructions.
+    """
+    x_lo, x_hi = radius, width - radius
+    y_lo, y_hi = radius, height - radius
+    for i in range(xs.shape[0]):
+        x = xs[i] + vxs[i] * dt
+        y = ys[i] + vys[i] * dt
+
+        # Collision with left/right walls
+        vxs[i] = -vxs[i] if (x < x_lo) | (x > x_hi) else vxs[i]
+        xs[i] = min(max(x, x_lo), x_hi)
+
+        # Collision with top/bottom walls
+        vys[i] = -vys[i] if (y < y_lo) | (y > y_hi) else vys[i]
+        ys[i] = min(max(y, y_lo), y_hi)
+
+
+@njit(cache=True, fastmath=True)
+def handle_disk_collision(xs, ys, vxs, vys, coins, hist, i, j, two_r_sq, max_coins, random_pool):
+    """
+    Check if disks i and j collide, i.e. overlap while moving toward each other.
+    If they do, perform elastic collision and coin exchange.
+    two_r_sq is the squared contact distance (2 * radius) ** 2, worked out once by the caller.
+    hist[c] is the number of disks holding c coins and is kept in step with coins.
+    Returns True if a collision actually happened, otherwise False.
+    """
+    dx = xs[j] - xs[i]
+    dy = ys[j] - ys[i]
+    d2 = dx*dx + dy*dy
+    # Compare squared distances so non-colliding pairs never pay for the sqrt
+    if d2 >= two_r_sq:
+        return False
+
+    return resolve_disk_collision(xs, ys, vxs, vys, coins, hist, i, j, dx, dy, d2,
+                                  max_coins, random_pool)
+
+
+@njit(cache=True, fastmath=True)
+def resolve_disk_collision(xs, ys, vxs, vys, coins, hist, i, j, dx, dy, d2,
+                           max_coins, random_pool):
+    """
+    Perform the elastic collision and coin exchange of overlapping disks i and j,
+    unless they are already moving apart.
+    (dx, dy) is the offset from disk i to disk j and d2 = dx*dx + dy*dy, as
+    already worked out by the caller's overlap test.
+    Returns True if a collision actually happened, otherwise False.
+    """
+    # Take the sqrt once, for overlapping pairs only, and normalize with two multiplies
+    # instead of two divides.
+    # Avoid division by zero by adding a small epsilon
+    inv_dist = 1.0 / max(math.sqrt(d2), EPSILON)
+
+    # --- Simple elastic collision for equal masses ---
+    # Swap the normal velocity components: project the relative velocity onto
+    # the normal once (dvn = v2n - v1n) and move that much between the disks.
+    # Each update is a multiply-add, which fastmath lets LLVM fuse into an FMA.
+    nx = dx * inv_dist
+    ny = dy * inv_dist
+    dvn = (vxs[j] - vxs[i]) * nx + (vys[j] - vys[i]) * ny
+    # Disks that still overlap after bouncing are separating (dvn >= 0); resolving
+    # them again would swap their velocities back and count a repeat collision
+    # on every physics step until they come apart
+    if dvn >= 0:
+        return False
+
+    vxs[i] += dvn * nx
+    vys[i] += dvn * ny
+    vxs[j] -= dvn * nx
+    vys[j] -= dvn * ny
+
+    # --- Coin exchange ---
+    total_coins_disk1 = coins[i]
+    total_coins_disk2 = coins[j]
+
+    # For disk1's coins (each one moves with probability 0.5):
+    coins_moving_to_disk2 = fair_coin_flips(total_coins_disk1, random_pool)
+    coins[i] -= coins_moving_to_disk2
+    coins[j] += coins_moving_to_disk2
+
+    # For disk2's coins (each one moves with probability 0.5):
+    coins_moving_to_disk1 = fair_coin_flips(total_coins_disk2, random_pool)
+    coins[j] -= coins_moving_to_disk1
+    coins[i] += coins_moving_to_disk1
+
+    # Clamp coin counts
+    coins[i] = min(coins[i], max_coins)
+    coins[j] = min(coins[j], max_coins)
+
+    # Only these two disks changed, so patch the histogram instead of recounting it
+    hist[total_coins_disk1] -= 1
+    hist[total_coins_disk2] -= 1
+    hist[coins[i]] += 1
+    hist[coins[j]] += 1
+
+    return True
+
+
+@njit(cache=True)
+def _add_candidate(xs, ys, a, b, reach_sq, candidates, n_candidates):
+    """Append the pair (a, b) to candidates, ordered i < j, if the disks are within reach."""
+    dx = xs[b] - xs[a]
+    dy = ys[b] - ys[a]
+    if dx*dx + dy*dy < reach_sq:
+        candidates[n_candidates, 0] = min(a, b)
+        candidates[n_candidates, 1] = max(a, b)
+        n_candidates += 1
+    return n_candidates
+
+
+@njit(cache=True)
+def build_grid(xs, ys, cell_size, grid_w, grid_h):
+    """
+    Bucket disk indices into a uniform grid of cell_size squares.
+
+    Returns (cell_start, cell_disks): the disks in cell c = cy*grid_w + cx are
+    cell_disks[cell_start[c]:cell_start[c + 1]] (a counting sort by cell).
+    """
+    n = xs.shape[0]
+    n_cells = grid_w * grid_h
+    cell_of = np.empty(n, dtype=np.int64)
+    cell_start = np.zeros(n_cells + 1, dtype=np.int64)
+    for i in range(n):
+        cx = min(int(xs[i] / cell_size), grid_w - 1)
+        cy = min(int(ys[i] / cell_size), grid_h - 1)
+        cell_of[i] = cy * grid_w + cx
+        cell_start[cell_of[i] + 1] += 1
+    for c in range(n_cells):
+        cell_start[c + 1] += cell_start[c]
+
+    cell_disks = np.empty(n, dtype=np.int64)
+    fill = cell_start[:n_cells].copy()
+    for i in range(n):
+        cell_disks[fill[cell_of[i]]] = i
+        fill[cell_of[i]] += 1
+    return cell_start, cell_disks
+
+
+@njit(cache=True)
+def grid_candidates(xs, ys, reach, width, height, candidates):
+    """
+    Find every pair of disks whose centers are closer than reach, using a
+    uniform-grid broad phase.
+
+    With cells of size reach, such pairs always share a cell or sit in
+    neighbouring cells. Each cell is tested against itself and against its
+    (+1, 0), (-1, +1), (0, +1), (+1, +1) neighbours, so every pair of adjacent
+    cells is visited exactly once.
+    Returns the number of pairs written to candidates.
+    """
+    grid_w = int(width // reach) + 1
+    grid_h = int(height // reach) + 1
+    cell_start, cell_disks = build_grid(xs, ys, reach, grid_w, grid_h)
+    reach_sq = reach * reach
+
+    n_candidates = 0
+    for cy in range(grid_h):
+        for cx in range(grid_w):
+            c = cy * grid_w + cx
+            start, end = cell_start[c], cell_start[c + 1]
+
+            # Pairs within the cell
+            for p in range(start, end):
+                for q in range(p + 1, end):
+                    n_candidates = _add_candidate(xs, ys, cell_disks[p], cell_disks[q],
+                                                  reach_sq, candidates, n_candidates)
+
+            # Pairs with the forward half of the neighbouring cells
+            for ox, oy in ((1, 0), (-1, 1), (0, 1), (1, 1)):
+                ncx, ncy = cx + ox, cy + oy
+                if ncx < 0 or ncx >= grid_w or ncy >= grid_h:
+                    continue
+                nc = ncy * grid_w + ncx
+                for p in range(start, end):
+                    for q in range(cell_start[nc], cell_start[nc + 1]):
+                        n_candidates = _add_candidate(xs, ys, cell_disks[p], cell_disks[q],
+                                                      reach_sq, candidates, n_candidates)
+    return n_candidates
+
+
+@njit(cache=True)
+def sort_sweep_order(xs, order):
+    """
+    Insertion-sort the disk indices in order by x coordinate, in place.
+
+    Disks move very little between frames, so order is nearly sorted already and
+    this pass is close to O(N).
+    """
+    for k in range(1, order.shape[0]):
+        idx = order[k]
+        x = xs[idx]
+        m = k - 1
+        while m >= 0 and xs[order[m]] > x:
+            order[m + 1] = order[m]
+            m -= 1
+        order[m + 1] = idx
+
+
+@njit(cache=True)
+def sweep_candidates(xs, ys, reach, order, candidates):
+    """
+    Find every pair of disks whose centers are closer than reach, using a
+    sweep-and-prune broad phase on the x axis.
+
+    order is a persistent permutation of the disk indices, kept sorted by x across
+    frames. Only disks whose x coordinates are within reach of each other are
+    compared.
+    Returns the number of pairs written to candidates.
+    """
+    sort_sweep_order(xs, order)
+    reach_sq = reach * reach
+
+    n = order.shape[0]
+    n_candidates = 0
+    for p in range(n):
+        i = order[p]
+        for q in range(p + 1, n):
+            j = order[q]
+            if xs[j] - xs[i] >= reach:
+                break
+            n_candidates = _add_candidate(xs, ys, i, j, reach_sq, candidates, n_candidates)
+    return n_candidates
+
+
+@njit(cache=True)
+def build_quadtree(xs, ys, width, height):
+    """
+    Build a point-region quadtree over the disk centers, stored as flat arrays.
+
+    Returns (bounds, start, count, child, perm). Node k covers the box
+    bounds[k] = (x0, y0, x1, y1) and owns the disks perm[start[k]:start[k] + count[k]].
+    child[k] is the index of its first of four consecutive children, or -1 for
+    a leaf. A node is split while it holds more than QUADTREE_CAPACITY disks.
+    """
+    n = xs.shape[0]
+    max_nodes = 1 + 4 * QUADTREE_MAX_DEPTH * (n // (QUADTREE_CAPACITY + 1) + 1)
+    bounds = np.empty((max_nodes, 4), dtype=np.float64)
+    start = np.empty(max_nodes, dtype=np.int64)
+    count = np.empty(max_nodes, dtype=np.int64)
+    child = np.full(max_nodes, -1, dtype=np.int64)
+    depth = np.empty(max_nodes, dtype=np.int64)
+    perm = np.arange(n)
+    scratch = np.empty(n, dtype=np.int64)
+    quadrant = np.empty(n, dtype=np.int64)
+
+    bounds[0, 0], bounds[0, 1], bounds[0, 2], bounds[0, 3] = 0.0, 0.0, width, height
+    start[0], count[0], depth[0] = 0, n, 0
+    n_nodes = 1
+
+    # Nodes are appended in breadth-first order, so walking the arrays visits
+    # every node after its parent has been split
+    k = 0
+    while k < n_nodes:
+        if count[k] > QUADTREE_CAPACITY and depth[k] < QUADTREE_MAX_DEPTH:
+            x0, y0, x1, y1 = bounds[k, 0], bounds[k, 1], bounds[k, 2], bounds[k, 3]
+            mx, my = 0.5 * (x0 + x1), 0.5 * (y0 + y1)
+            lo, hi = start[k], start[k] + count[k]
+
+            # Counting sort the node's disks by quadrant: 0 = lower left,
+            # 1 = lower right, 2 = upper left, 3 = upper right
+            quad_count = np.zeros(4, dtype=np.int64)
+            for p in range(lo, hi):
+                d = perm[p]
+                quadrant[d] = (xs[d] >= mx) + 2 * (ys[d] >= my)
+                quad_count[quadrant[d]] += 1
+            fill = np.empty(4, dtype=np.int64)
+            fill[0] = lo
+            for q in range(1, 4):
+                fill[q] = fill[q - 1] + quad_count[q - 1]
+            for p in range(lo, hi):
+                d = perm[p]
+                scratch[fill[quadrant[d]]] = d
+                fill[quadrant[d]] += 1
+            perm[lo:hi] = scratch[lo:hi]
+
+            child[k] = n_nodes
+            offset = lo
+            for q in range(4):
+                c = n_nodes + q
+                bounds[c, 0] = mx if q & 1 else x0
+                bounds[c, 1] = my if q & 2 else y0
+                bounds[c, 2] = x1 if q & 1 else mx
+                bounds[c, 3] = y1 if q & 2 else my
+                start[c] = offset
+                count[c] = quad_count[q]
+                depth[c] = depth[k] + 1
+                offset += quad_count[q]
+            n_nodes += 4
+        k += 1
+
+    return bounds[:n_nodes], start[:n_nodes], count[:n_nodes], child[:n_nodes], perm
+
+
+@njit(cache=True)
+def quadtree_candidates(xs, ys, reach, width, height, candidates):
+    """
+    Find every pair of disks whose centers are closer than reach, using a
+    quadtree broad phase.
+
+    Each disk queries the tree with the box [x - reach, x + reach] x
+    [y - reach, y + reach] and only visits leaves that overlap it. Unlike the
+    uniform grid, this keeps the number of tests low when disks cluster.
+    Returns the number of pairs written to candidates.
+    """
+    bounds, start, count, child, perm = build_quadtree(xs, ys, width, height)
+    reach_sq = reach * reach
+    stack = np.empty(3 * QUADTREE_MAX_DEPTH + 1, dtype=np.int64)
+
+    n_candidates = 0
+    for i in range(xs.shape[0]):
+        qx0, qx1 = xs[i] - reach, xs[i] + reach
+        qy0, qy1 = ys[i] - reach, ys[i] + reach
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            k = stack[top]
+            if (bounds[k, 0] > qx1 or bounds[k, 2] < qx0
+                    or bounds[k, 1] > qy1 or bounds[k, 3] < qy0):
+                continue
+            if child[k] >= 0:
+                for q in range(4):
+                    stack[top] = child[k] + q
+                    top += 1
+                continue
+            for p in range(start[k], start[k] + count[k]):
+                # Each pair is found from both ends; keep it only once
+                if perm[p] > i:
+                    n_candidates = _add_candidate(xs, ys, i, perm[p],
+                                                  reach_sq, candidates, n_candidates)
+    return n_candidates
+
+
+@njit(cache=True)
+def collide_candidates(xs, ys, vxs, vys, coins, hist, candidates, n_candidates,
+                       two_r_sq, max_coins, random_pool, hist_log):
+    """
+    Run the narrow phase on the first n_candidates pairs of candidates.
+
+    hist_log[k] is set to the coin histogram right after collision k.
+    Returns the number of collisions that happened.
+    """
+    n_collisions = 0
+    for k in range(n_candidates):
+        i, j = candidates[k, 0], candidates[k, 1]
+        if handle_disk_collision(xs, ys, vxs, vys, coins, hist, i, j,
+                                 two_r_sq, max_coins, random_pool):
+            hist_log[n_collisions, :] = hist
+            n_collisions += 1
+    return n_collisions
+
+
+@njit(cache=True)
+def collide_all_pairs(xs, ys, vxs, vys, coins, hist, two_r_sq, max_coins, random_pool,
+                      hist_log):
+    """
+    Narrow phase over every pair (i, j), i < j, with no broad phase at all.
+
+    With a handful of disks this beats keeping a candidate list: the overlap
+    test is done inline in the loop, and only overlapping pairs are handed,
+    with the offset already computed, to resolve_disk_collision(). Records
+    collisions like collide_candidates().
+    """
+    n_collisions = 0
+    for i in range(xs.shape[0]):
+        for j in range(i + 1, xs.shape[0]):
+            dx = xs[j] - xs[i]
+            dy = ys[j] - ys[i]
+            d2 = dx*dx + dy*dy
+            if d2 >= two_r_sq:
+                continue
+            if resolve_disk_collision(xs, ys, vxs, vys, coins, hist, i, j, dx, dy, d2,
+                                      max_coins, random_pool):
+                hist_log[n_collisions, :] = hist
+                n_collisions += 1
+    return n_collisions
+
+
+@njit(cache=True)
+def _max_displacement_sq(xs, ys, ref_xs, ref_ys):
+    """Largest squared distance any disk has moved away from (ref_xs, ref_ys)."""
+    max_d2 = 0.0
+    for i in range(xs.shape[0]):
+        dx = xs[i] - ref_xs[i]
+        dy = ys[i] - ref_ys[i]
+        max_d2 = max(max_d2, dx*dx + dy*dy)
+    return max_d2
+
+
+@njit(cache=True)
+def step(xs, ys, vxs, vys, coins, hist, radius, width, height, max_coins, dt, random_pool,
+         broad_phase, broad_phase_state, hist_log):
+    """
+    Advance the simulation by dt: move the disks, then resolve every colliding pair.
+    Coin flips are drawn from random_pool (see make_random_pool()), and hist
+    (see make_coin_histogram()) is updated along with coins.
+
+    broad_phase selects how candidate pairs are found: "grid" for the uniform
+    grid, "sweep" for sweep-and-prune, or "quadtree", which copes best with
+    many disks that are not spread out evenly. broad_phase_state comes from
+    make_broad_phase_state(). The candidate list holds every pair within
+    2*radius + skin (skin = SKIN_FRACTION * radius) and is reused across steps
+    until some disk has moved more than skin / 2 since it was built, which
+    guarantees no colliding pair is missed in between. "all" skips the broad
+    phase and tests every pair each step, which is cheapest for a handful of
+    disks since it never needs the displacement check or a rebuild.
+
+    hist_log[k] is set to the coin histogram right after collision k, so callers
+    can replay per-collision statistics; it needs room for N*(N-1)/2 rows.
+    Returns the number of collisions that happened.
+    """
+    sweep_order, candidates, n_candidates, ref_xs, ref_ys = broad_phase_state
+    update_positions(xs, ys, vxs, vys, radius, width, height, dt)
+
+    # Contact distance, worked out once per step rather than once per pair
+    two_r = 2 * radius
+    two_r_sq = two_r * two_r
+
+    if broad_phase == "all":
+        return collide_all_pairs(xs, ys, vxs, vys, coins, hist, two_r_sq, max_coins,
+                                 random_pool, hist_log)
+
+    skin = SKIN_FRACTION * radius
+    if (n_candidates[0] < 0
+            or _max_displacement_sq(xs, ys, ref_xs, ref_ys) > (skin / 2) ** 2):
+        reach = two_r + skin
+        if broad_phase == "sweep":
+            n_candidates[0] = sweep_candidates(xs, ys, reach, sweep_order, candidates)
+        elif broad_phase == "quadtree":
+            n_candidates[0] = quadtree_candidates(xs, ys, reach, width, height, candidates)
+        else:
+            n_candidates[0] = grid_candidates(xs, ys, reach, width, height, candidates)
+        ref_xs[:] = xs
+        ref_ys[:] = ys
+
+    return collide_candidates(xs, ys, vxs, vys, coins, hist, candidates, n_candidates[0],
+                              two_r_sq, max_coins, random_pool, hist_log)
+
+
+def make_coin_histogram(coins, max_coins):
+    """Count how many disks hold 0..max_coins coins; step() keeps the result current."""
+    # A longer histogram would not fit the max_coins + 1 columns of hist_log
+    assert coins.max() <= max_coins, "a disk starts with more than max_coins coins"
+    return np.bincount(coins, minlength=max_coins + 1).astype(np.int64)
+
+
+def make_hist_log(disk_count, max_coins):
+    """Allocate the hist_log output buffer that step() fills in."""
+    max_pairs = disk_count * (disk_count - 1) // 2
+    return np.empty((max_pairs, max_coins + 1), dtype=np.int64)
+
+
+def make_broad_phase_state(disk_count):
+    """
+    Allocate the broad phase state that step() keeps across calls:
+    (sweep_order, candidates, n_candidates, ref_xs, ref_ys).
+    """
+    max_pairs = disk_count * (disk_count - 1) // 2
+    sweep_order = np.arange(disk_count)
+    candidates = np.empty((max_pairs, 2), dtype=np.int64)
+    n_candidates = np.full(1, -1, dtype=np.int64)  # -1 forces a build on the first step
+    ref_xs = np.empty(disk_count, dtype=np.float64)
+    ref_ys = np.empty(disk_count, dtype=np.float64)
+    return sweep_order, candidates, n_candidates, ref_xs, ref_ys
+
+
+def make_random_pool(rng):
+    """
+    Wrap a NumPy Generator as (rng, bits, pos) for fair_coin_flips(): a buffer of
+    random 32-bit words that is refilled in bulk, and the read position in it.
+    """
+    bits = np.empty(RANDOM_POOL_SIZE, dtype=np.uint32)
+    pos = np.full(1, RANDOM_POOL_SIZE, dtype=np.int64)  # empty; filled on first use
+    return rng, bits, pos
+
+
+def _warm_up():
+    """Compile the kernels on import so the first simulation frame doesn't stall."""
+    xs = np.array([10.0, 15.0])
+    ys = np.array([10.0, 10.0])
+    vxs = np.array([1.0, -1.0])
+    vys = np.zeros(2)
+    coins = np.array([1, 0], dtype=np.int32)
+    random_pool = make_random_pool(np.random.default_rng())
+    hist = make_coin_histogram(coins, 1)
+    hist_log = make_hist_log(2, 1)
+    for broad_phase in ("all", "grid", "sweep", "quadtree"):
+        step(xs, ys, vxs, vys, coins, hist, 5, 100, 100, 1, 0.01, random_pool,
+             broad_phase, make_broad_phase_state(2), hist_log)
+
+
+_warm_up()
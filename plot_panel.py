@@ -0,0 +1,119 @@
+"""
+Pygame panel that plots running averages against the collision count, shared
+by the bouncing disk simulations.
+
+The panel keeps its data in preallocated NumPy buffers and draws straight onto
+the Pygame screen, so it can sit next to the disks in the same window.
+"""
+import numpy as np
+import pygame
+
+PLOT_CAPACITY = 100_000    # Max points kept per plot line (older points get thinned out)
+TEXT_COLOR = (200, 200, 200)
+# Line colors for up to 9 lines (Matplotlib's "tab:" palette)
+LINE_COLORS = [
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34)
+]
+
+
+class RunningAveragePlot:
+    """
+    One line per coin count 0..line_count-1, plotted against the collision count
+    in the screen rectangle rect, with y running from 0 to y_max.
+    """
+
+    def __init__(self, font, rect, y_label, y_max, line_count, capacity=PLOT_CAPACITY):
+        self.font = font
+        self.rect = pygame.Rect(rect)
+        self.area = pygame.Rect(self.rect.left + 60, self.rect.top + 20,
+                                self.rect.width - 80, self.rect.height - 70)
+        self.y_max = y_max
+
+        # Preallocated plot data: one shared x buffer, one y row per line
+        self.xdata = np.empty(capacity)
+        self.ydata = np.empty((line_count, capacity))
+        self.length = 0        # Number of points stored in the buffers
+        self.stride = 1        # Record a point every stride-th x value
+        self.x_latest = 0      # Latest x passed to record(), stored or not
+
+        # Fixed text, rendered once: axis labels, x and y tick labels and the legend
+        self.x_label = font.render("Collision Count", True, TEXT_COLOR)
+        self.x_min_text = font.render("0", True, TEXT_COLOR)
+        self.x_max = None      # x axis end the cached x_max_text was rendered for
+        self.x_max_text = None
+        self.y_label = pygame.transform.rotate(font.render(y_label, True, TEXT_COLOR), 90)
+        self.y_ticks = [(value, font.render(f"{value:g}", True, TEXT_COLOR))
+                        for value in (0, y_max / 2, y_max)]
+        self.legend = [font.render(f"{i} coins", True, LINE_COLORS[i])
+                       for i in range(line_count)]
+
+    def record(self, x, values):
+        """
+        Store values (one per line) at the integer x in the preallocated buffers.
+        When the buffers are full, every other point is dropped and from then on
+        only every stride-th x is recorded, so memory use stays bounded however
+        long the simulation runs.
+        """
+        self.x_latest = x
+        if x % self.stride:
+            return
+        if self.length == self.xdata.shape[0]:
+            half = self.length // 2
+            self.xdata[:half] = self.xdata[1::2]
+            self.ydata[:, :half] = self.ydata[:, 1::2]
+            self.length = half
+            self.stride *= 2
+            if x % self.stride:
+                return
+
+        self.xdata[self.length] = x
+        self.ydata[:, self.length] = values
+        self.length += 1
+
+    def draw(self, screen):
+        """Draw the panel with every line recorded so far onto screen."""
+        area = self.area
+        screen.fill((20, 20, 20), self.rect)
+        pygame.draw.rect(screen, (120, 120, 120), area, 1)
+
+        # Axes: y ticks and label on the left, x range and label below
+        for value, surface in self.y_ticks:
+            y = area.bottom - value / self.y_max * area.height
+            screen.blit(surface, surface.get_rect(midright=(area.left - 4, y)))
+        y_label_pos = (self.rect.left + 4, area.centery)
+        screen.blit(self.y_label, self.y_label.get_rect(midleft=y_label_pos))
+        # Round the x axis end up to 1, 2 or 5 times a power of ten, so its label
+        # only has to be rendered again when the axis grows past the next step
+        scale = 10
+        while 10 * scale < self.x_latest:
+            scale *= 10
+        x_max = next(m * scale for m in (1, 2, 5, 10) if m * scale >= self.x_latest)
+        if self.x_max != x_max:
+            self.x_max = x_max
+            self.x_max_text = self.font.render(str(x_max), True, TEXT_COLOR)
+        below = area.bottom + 4
+        screen.blit(self.x_min_text, self.x_min_text.get_rect(topleft=(area.left, below)))
+        screen.blit(self.x_max_text, self.x_max_text.get_rect(topright=(area.right, below)))
+        screen.blit(self.x_label, self.x_label.get_rect(midtop=(area.centerx, below + 20)))
+
+        # Lines, thinned out to about one point per pixel column and mapped to
+        # pixel coordinates with NumPy
+        if self.length >= 2:
+            idx = np.linspace(0, self.length - 1, min(self.length, area.width)).astype(np.int64)
+            px = area.left + self.xdata[idx] / x_max * area.width
+            py = area.bottom - self.ydata[:, idx] / self.y_max * area.height
+            screen.set_clip(area)
+            for i in range(len(self.ydata)):
+                points = np.column_stack((px, py[i])).tolist()
+                pygame.draw.lines(screen, LINE_COLORS[i], False, points)
+            screen.set_clip(None)
+
+        # Legend in the top right corner
+        for i, surface in enumerate(self.legend):
+            screen.blit(surface, (area.right - surface.get_width() - 6,
+                                  area.top + 4 + i * surface.get_height()))
+
+    def save(self, screen, path):
+        """Write the panel as last drawn on screen to the image file path."""
+        pygame.image.save(screen.subsurface(self.rect), path)
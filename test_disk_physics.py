@@ -0,0 +1,98 @@
+"""
+Cross-check the broad phases in disk_physics against brute force.
+
+Run with: python -m unittest test_disk_physics
+"""
+import unittest
+import numpy as np
+from disk_physics import (SKIN_FRACTION, grid_candidates, make_broad_phase_state,
+                          make_coin_histogram, make_hist_log, make_random_pool,
+                          quadtree_candidates, step, sweep_candidates)
+
+WIDTH, HEIGHT = 800, 600
+BROAD_PHASES = ("grid", "sweep", "quadtree")
+
+
+def brute_force_pairs(xs, ys, reach):
+    """Every pair (i, j), i < j, whose centers are closer than reach."""
+    pairs = set()
+    for i in range(len(xs)):
+        for j in range(i + 1, len(xs)):
+            if (xs[j] - xs[i]) ** 2 + (ys[j] - ys[i]) ** 2 < reach * reach:
+                pairs.add((i, j))
+    return pairs
+
+
+def broad_phase_pairs(broad_phase, xs, ys, reach):
+    """Run one broad phase from scratch and return its candidate pairs as a set."""
+    n = len(xs)
+    candidates = np.empty((n * (n - 1) // 2, 2), dtype=np.int64)
+    if broad_phase == "grid":
+        count = grid_candidates(xs, ys, reach, WIDTH, HEIGHT, candidates)
+    elif broad_phase == "sweep":
+        count = sweep_candidates(xs, ys, reach, np.arange(n), candidates)
+    else:
+        count = quadtree_candidates(xs, ys, reach, WIDTH, HEIGHT, candidates)
+    pairs = [tuple(pair) for pair in candidates[:count].tolist()]
+    assert len(pairs) == len(set(pairs)), "duplicate candidate pair"
+    return set(pairs)
+
+
+class BroadPhaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(1234)
+
+    def check_layout(self, xs, ys, reach):
+        expected = brute_force_pairs(xs, ys, reach)
+        for broad_phase in BROAD_PHASES:
+            with self.subTest(broad_phase=broad_phase, n=len(xs), reach=reach):
+                self.assertEqual(broad_phase_pairs(broad_phase, xs, ys, reach), expected)
+
+    def test_random_layouts(self):
+        for _ in range(50):
+            n = int(self.rng.integers(2, 120))
+            radius = float(self.rng.uniform(2, 60))
+            reach = (2 + SKIN_FRACTION) * radius
+            xs = self.rng.uniform(radius, WIDTH - radius, n)
+            ys = self.rng.uniform(radius, HEIGHT - radius, n)
+            self.check_layout(xs, ys, reach)
+
+    def test_clustered_layout(self):
+        centers = self.rng.uniform(100, 500, (4, 2))
+        points = centers[self.rng.integers(0, 4, 200)] + self.rng.normal(0, 15, (200, 2))
+        self.check_layout(np.clip(points[:, 0], 0, WIDTH), np.clip(points[:, 1], 0, HEIGHT), 25.0)
+
+    def test_disks_stacked_on_one_point(self):
+        # More disks on the same spot than a quadtree leaf holds, plus a few spread out
+        xs = np.concatenate((np.full(20, 300.0), self.rng.uniform(0, WIDTH, 10)))
+        ys = np.concatenate((np.full(20, 200.0), self.rng.uniform(0, HEIGHT, 10)))
+        self.check_layout(xs, ys, 50.0)
+
+    def test_step_keeps_every_overlapping_pair_in_the_candidate_list(self):
+        # The candidate list is reused across steps; after each one it must still
+        # hold every pair that overlaps at the positions the narrow phase saw
+        n, radius, max_coins = 60, 15.0, 8
+        for broad_phase in BROAD_PHASES:
+            xs = self.rng.uniform(radius, WIDTH - radius, n)
+            ys = self.rng.uniform(radius, HEIGHT - radius, n)
+            vxs = self.rng.uniform(-400, 400, n)
+            vys = self.rng.uniform(-400, 400, n)
+            coins = self.rng.integers(0, max_coins + 1, n).astype(np.int32)
+            hist = make_coin_histogram(coins, max_coins)
+            state = make_broad_phase_state(n)
+            hist_log = make_hist_log(n, max_coins)
+            random_pool = make_random_pool(self.rng)
+            for _ in range(300):
+                step(xs, ys, vxs, vys, coins, hist, radius, WIDTH, HEIGHT, max_coins, 1 / 240,
+                     random_pool, broad_phase, state, hist_log)
+                candidates, n_candidates = state[1], state[2][0]
+                listed = {tuple(pair) for pair in candidates[:n_candidates].tolist()}
+                with self.subTest(broad_phase=broad_phase):
+                    self.assertLessEqual(brute_force_pairs(xs, ys, 2 * radius), listed)
+                    np.testing.assert_array_equal(
+                        hist, np.bincount(coins, minlength=max_coins + 1))
+
+
+if __name__ == "__main__":
+    unittest.main()